@@ -2,8 +2,26 @@ import sqlite3
 from pathlib import Path
 from typing import Iterable, List, Optional
 
+import aiosqlite
+
 DB_PATH = Path(__file__).parent / "bot.db"
 
+# WAL + tuned pragmas: commits become cheap log appends instead of
+# multiple fsyncs, and hot reads hit a warm 64MB page cache. Safe for
+# a single-writer bot; synchronous=NORMAL still survives app crashes.
+_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA cache_size=-64000;
+PRAGMA temp_store=MEMORY;
+PRAGMA busy_timeout=5000;
+PRAGMA mmap_size=134217728;
+"""
+
+# Roomy prepared-statement cache: the bot cycles through the same handful
+# of statements, so none of them should ever be evicted and re-prepared.
+_CACHED_STATEMENTS = 256
+
 # Predefined processes to seed the database on first run.
 DEFAULT_PROCESSES: List[dict] = [
     {
@@ -37,10 +55,60 @@ DEFAULT_PROCESSES: List[dict] = [
 ]
 
 
+def _process_row(item: dict) -> tuple:
+    """Flatten a process dict into the executemany parameter tuple."""
+    reminders = item.get("reminders") or (None, None)
+    return (
+        item["name"],
+        item["owner_name"],
+        item["periodicity"],
+        item["deadline_time"],
+        reminders[0],
+        reminders[1],
+    )
+
+
+# Seed rows flattened once at import so executemany binds plain tuples
+# without per-row dict lookups.
+_DEFAULT_ROWS = tuple(_process_row(item) for item in DEFAULT_PROCESSES)
+
+# Hot-path statements as module constants: sqlite3's statement cache keys
+# on the exact SQL text, so the prepared opcode stream is reused. Explicit
+# column lists avoid shipping unused timestamp columns, and the owner
+# lookup skips ORDER BY — callers that need an order sort themselves.
+_SQL_USER_BY_TG = (
+    "SELECT id, telegram_id, tg_username, name FROM users WHERE telegram_id = ?;"
+)
+_SQL_PROCS_BY_OWNER = (
+    "SELECT id, name, periodicity, deadline_time,"
+    " reminder_minutes_before_1, reminder_minutes_before_2"
+    " FROM processes WHERE owner_name = ?;"
+)
+_SQL_ANY_REMINDER_SENT = (
+    "SELECT 1 FROM reminder_logs"
+    " WHERE user_id = ? AND process_id = ? AND deadline_date = ? LIMIT 1;"
+)
+
+
 def get_connection() -> sqlite3.Connection:
+    """Synchronous connection for one-shot work (schema init, exports)."""
     # check_same_thread=False allows reuse from FastAPI event loop threads.
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn = sqlite3.connect(
+        DB_PATH, check_same_thread=False, cached_statements=_CACHED_STATEMENTS
+    )
+    conn.row_factory = sqlite3.Row
+    conn.executescript(_PRAGMAS)
+    return conn
+
+
+async def get_async_connection() -> aiosqlite.Connection:
+    """
+    Connection for the bot's event loop: queries yield to the loop instead
+    of blocking long polling. Same WAL pragmas as the sync path.
+    """
+    conn = await aiosqlite.connect(DB_PATH, cached_statements=_CACHED_STATEMENTS)
     conn.row_factory = sqlite3.Row
+    await conn.executescript(_PRAGMAS)
     return conn
 
 
@@ -85,6 +153,18 @@ def init_db(conn: sqlite3.Connection) -> None:
         );
         """
     )
+    # Secondary indexes for the reminder-tick lookups: owner_name probes
+    # become B-tree seeks, and the covering reminder_logs index answers
+    # any_reminder_sent without touching table rows.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_processes_owner ON processes(owner_name);"
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_reminder_logs_lookup
+        ON reminder_logs(user_id, process_id, deadline_date, reminder_idx);
+        """
+    )
     conn.commit()
 
 
@@ -105,31 +185,22 @@ def seed_default_processes(conn: sqlite3.Connection) -> None:
             reminder_minutes_before_2
         ) VALUES (?, ?, ?, ?, ?, ?);
         """,
-        (
-            (
-                item["name"],
-                item["owner_name"],
-                item["periodicity"],
-                item["deadline_time"],
-                item["reminders"][0] if item["reminders"] else None,
-                item["reminders"][1] if item["reminders"] else None,
-            )
-            for item in DEFAULT_PROCESSES
-        ),
+        _DEFAULT_ROWS,
     )
     conn.commit()
 
 
-def get_user(conn: sqlite3.Connection, telegram_id: int) -> Optional[sqlite3.Row]:
-    return conn.execute(
-        "SELECT * FROM users WHERE telegram_id = ?;", (telegram_id,)
-    ).fetchone()
+async def get_user(
+    conn: aiosqlite.Connection, telegram_id: int
+) -> Optional[sqlite3.Row]:
+    cur = await conn.execute(_SQL_USER_BY_TG, (telegram_id,))
+    return await cur.fetchone()
 
 
-def register_user(
-    conn: sqlite3.Connection, telegram_id: int, name: str, username: Optional[str]
+async def register_user(
+    conn: aiosqlite.Connection, telegram_id: int, name: str, username: Optional[str]
 ) -> None:
-    conn.execute(
+    await conn.execute(
         """
         INSERT INTO users (telegram_id, tg_username, name)
         VALUES (?, ?, ?)
@@ -140,20 +211,31 @@ def register_user(
         """,
         (telegram_id, username, name),
     )
-    conn.commit()
+    await conn.commit()
 
 
-def get_processes_for_owner(
-    conn: sqlite3.Connection, owner_name: str
+async def get_processes_for_owner(
+    conn: aiosqlite.Connection, owner_name: str
 ) -> List[sqlite3.Row]:
-    cur = conn.execute(
-        "SELECT * FROM processes WHERE owner_name = ? ORDER BY id;", (owner_name,)
-    )
-    return cur.fetchall()
+    cur = await conn.execute(_SQL_PROCS_BY_OWNER, (owner_name,))
+    return await cur.fetchall()
 
 
-def get_all_processes(conn: sqlite3.Connection) -> List[sqlite3.Row]:
-    cur = conn.execute("SELECT * FROM processes ORDER BY owner_name, id;")
+def get_all_processes(
+    conn: sqlite3.Connection, row_factory: Optional[type] = sqlite3.Row
+) -> List[sqlite3.Row]:
+    """
+    All processes ordered by owner. Pass ``row_factory=None`` to get plain
+    tuples, skipping Row wrapping for bulk consumers like the sheet export.
+    """
+    cur = conn.execute(
+        """
+        SELECT id, name, owner_name, periodicity, deadline_time,
+               reminder_minutes_before_1, reminder_minutes_before_2
+        FROM processes ORDER BY owner_name, id;
+        """
+    )
+    cur.row_factory = row_factory
     return cur.fetchall()
 
 
@@ -162,8 +244,8 @@ def get_all_users(conn: sqlite3.Connection) -> List[sqlite3.Row]:
     return cur.fetchall()
 
 
-def record_reminder_sent(
-    conn: sqlite3.Connection,
+async def record_reminder_sent(
+    conn: aiosqlite.Connection,
     user_id: int,
     process_id: int,
     deadline_date: str,
@@ -171,8 +253,12 @@ def record_reminder_sent(
 ) -> bool:
     """
     Persist the fact we sent this reminder. Returns True if inserted, False if already present.
+
+    Does not commit: the caller batches all inserts of one reminder tick
+    into a single transaction and commits once, so the whole tick costs
+    one disk flush instead of one per row.
     """
-    cur = conn.execute(
+    cur = await conn.execute(
         """
         INSERT INTO reminder_logs (user_id, process_id, deadline_date, reminder_idx)
         VALUES (?, ?, ?, ?)
@@ -180,20 +266,53 @@ def record_reminder_sent(
         """,
         (user_id, process_id, deadline_date, reminder_idx),
     )
-    conn.commit()
     return cur.rowcount > 0
 
 
+async def get_due_reminders(
+    conn: aiosqlite.Connection, deadline_date: str
+) -> List[tuple]:
+    """
+    One query for the whole reminder tick: every (user, process) pair joined
+    on owner name, with a bitmask of reminder indexes already logged for
+    ``deadline_date`` (bit ``1 << reminder_idx``), so the loop never issues
+    per-user queries or re-checks sent reminders in Python.
+
+    Returns plain tuples in the SELECT's column order — the tick loop
+    unpacks positionally, skipping Row name lookups per column.
+    """
+    cur = await conn.execute(
+        """
+        SELECT
+            u.telegram_id,
+            u.id AS user_id,
+            p.id AS process_id,
+            p.name,
+            p.periodicity,
+            p.deadline_time,
+            p.reminder_minutes_before_1,
+            p.reminder_minutes_before_2,
+            COALESCE(r.mask, 0) AS sent_mask
+        FROM users u
+        JOIN processes p ON p.owner_name = u.name
+        LEFT JOIN (
+            SELECT user_id, process_id, SUM(1 << reminder_idx) AS mask
+            FROM reminder_logs
+            WHERE deadline_date = ?
+            GROUP BY user_id, process_id
+        ) r ON r.user_id = u.id AND r.process_id = p.id;
+        """,
+        (deadline_date,),
+    )
+    cur.row_factory = None
+    return await cur.fetchall()
+
+
 def any_reminder_sent(
     conn: sqlite3.Connection, user_id: int, process_id: int, deadline_date: str
 ) -> bool:
     cur = conn.execute(
-        """
-        SELECT 1 FROM reminder_logs
-        WHERE user_id = ? AND process_id = ? AND deadline_date = ?
-        LIMIT 1;
-        """,
-        (user_id, process_id, deadline_date),
+        _SQL_ANY_REMINDER_SENT, (user_id, process_id, deadline_date)
     )
     return cur.fetchone() is not None
 
@@ -211,16 +330,6 @@ def upsert_processes(conn: sqlite3.Connection, processes: Iterable[dict]) -> Non
             reminder_minutes_before_2
         ) VALUES (?, ?, ?, ?, ?, ?);
         """,
-        (
-            (
-                item["name"],
-                item["owner_name"],
-                item["periodicity"],
-                item["deadline_time"],
-                item.get("reminders", (None, None))[0],
-                item.get("reminders", (None, None))[1],
-            )
-            for item in processes
-        ),
+        [_process_row(item) for item in processes],
     )
     conn.commit()
@@ -21,41 +21,43 @@ def export():
         )
 
     conn = get_connection()
-    processes = get_all_processes(conn)
 
     gc = gspread.service_account(filename=credentials_path)
     sh = gc.open_by_key(sheet_id)
 
     try:
-        ws = sh.worksheet("Processes")
-        ws.clear()
+        sh.worksheet("Processes")
     except gspread.WorksheetNotFound:
-        ws = sh.add_worksheet(title="Processes", rows="50", cols="6")
+        sh.add_worksheet(title="Processes", rows="50", cols="6")
 
-    rows: List[List[str]] = [
-        [
-            "Название",
-            "Ответственный",
-            "Периодичность",
-            "Дедлайн",
-            "Напоминание 1 (мин)",
-            "Напоминание 2 (мин)",
-        ]
+    header = [
+        "Название",
+        "Ответственный",
+        "Периодичность",
+        "Дедлайн",
+        "Напоминание 1 (мин)",
+        "Напоминание 2 (мин)",
     ]
-    for p in processes:
-        rows.append(
-            [
-                p["name"],
-                p["owner_name"],
-                p["periodicity"],
-                p["deadline_time"],
-                str(p["reminder_minutes_before_1"] or ""),
-                str(p["reminder_minutes_before_2"] or ""),
-            ]
+    # Raw tuples straight into value lists: one pass, no intermediate
+    # list of Row objects.
+    rows: List[List[str]] = [header] + [
+        [name, owner, periodicity, deadline, str(rem1 or ""), str(rem2 or "")]
+        for (_id, name, owner, periodicity, deadline, rem1, rem2) in (
+            get_all_processes(conn, row_factory=None)
         )
+    ]
 
-    ws.update(rows)
-    print("Exported", len(processes), "rows to worksheet Processes.")
+    # One batch clear + one batch update instead of per-worksheet calls:
+    # two values API round-trips total, which also keeps us clear of the
+    # Sheets per-minute request quota on repeated exports.
+    sh.values_batch_clear(body={"ranges": ["Processes!A:F"]})
+    sh.values_batch_update(
+        {
+            "valueInputOption": "RAW",
+            "data": [{"range": "Processes!A1", "values": rows}],
+        }
+    )
+    print("Exported", len(rows) - 1, "rows to worksheet Processes.")
 
 
 if __name__ == "__main__":
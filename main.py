@@ -1,16 +1,18 @@
 import asyncio
+import functools
 import logging
 import os
 from datetime import datetime, time, timedelta
 from typing import Dict, Optional
 
+import aiosqlite
 import httpx
 from dotenv import load_dotenv
 
 from db import (
-    get_all_processes,
-    get_all_users,
+    get_async_connection,
     get_connection,
+    get_due_reminders,
     get_processes_for_owner,
     get_user,
     init_db,
@@ -34,44 +36,87 @@ if not TELEGRAM_TOKEN:
 
 TELEGRAM_API = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}"
 
-# Single global connection is OK for this simple demo app.
-CONN = get_connection()
-init_db(CONN)
-seed_default_processes(CONN)
+# Schema setup and seeding run once at import over a short-lived sync
+# connection; runtime queries go through the shared async CONN below.
+_conn = get_connection()
+init_db(_conn)
+seed_default_processes(_conn)
+_conn.close()
+
+# Single global async connection is OK for this single-writer demo app;
+# opened in main() so DB calls yield to the event loop instead of
+# blocking getUpdates polling.
+CONN: aiosqlite.Connection
 
 REMINDER_MINUTES = [120, 60]  # 2ч, 1ч до дедлайна
 
+# One shared client for all Telegram calls: keep-alive connections are
+# reused instead of paying a TCP+TLS handshake per sendMessage.
+HTTP = httpx.AsyncClient(
+    base_url=TELEGRAM_API,
+    timeout=10,
+    limits=httpx.Limits(max_keepalive_connections=20),
+)
+
+
+# Caps concurrent sendMessage calls; Telegram allows ~30 msg/sec globally.
+SEND_SEMAPHORE = asyncio.Semaphore(20)
+
+# Reminder sends go through this queue so a slow Telegram response never
+# stalls the next reminder tick; sender_worker tasks drain it.
+SEND_QUEUE: "asyncio.Queue[tuple[int, str]]" = asyncio.Queue()
+SEND_WORKERS = 5
+
+
+async def sender_worker() -> None:
+    while True:
+        chat_id, text = await SEND_QUEUE.get()
+        try:
+            await send_message(chat_id, text)
+        finally:
+            SEND_QUEUE.task_done()
+
 
 async def send_message(chat_id: int, text: str) -> None:
     try:
-        async with httpx.AsyncClient() as client:
-            await client.post(
-                f"{TELEGRAM_API}/sendMessage",
+        async with SEND_SEMAPHORE:
+            await HTTP.post(
+                "/sendMessage",
                 json={"chat_id": chat_id, "text": text},
-                timeout=10,
             )
     except Exception as exc:
         logger.error("Failed to send Telegram message: %s", exc)
 
 
+# Maps the separator variants users type to the canonical ones in one
+# C-level pass instead of four chained .replace() allocations.
+_CHECK_NORM = str.maketrans({".": "-", "/": "-", ",": " ", "T": " "})
+
+
 def parse_check_datetime(text: str) -> Optional[datetime]:
     parts = text.strip().split(maxsplit=1)
     if len(parts) < 2:
         return None
-    raw = parts[1]
-    normalized = (
-        raw.replace(".", "-").replace("/", "-").replace(",", " ").replace("T", " ")
-    )
+    normalized = parts[1].translate(_CHECK_NORM)
     try:
         date_str, time_str = normalized.split()
-        dt = datetime.strptime(f"{date_str} {time_str}", "%d-%m-%Y %H:%M")
-        return dt
+        if len(date_str) != 10 or len(time_str) != 5:
+            return None
+        # DD-MM-YYYY HH:MM parsed by slicing; strptime's format machinery
+        # is far slower and the shape is already fixed above.
+        return datetime(
+            int(date_str[6:10]),
+            int(date_str[3:5]),
+            int(date_str[0:2]),
+            int(time_str[0:2]),
+            int(time_str[3:5]),
+        )
     except Exception:
         return None
 
 
-def format_process_list(owner_name: str) -> str:
-    processes = get_processes_for_owner(CONN, owner_name)
+async def format_process_list(owner_name: str) -> str:
+    processes = await get_processes_for_owner(CONN, owner_name)
     if not processes:
         return "За вами пока не закреплены процессы."
 
@@ -87,25 +132,83 @@ def format_process_list(owner_name: str) -> str:
     return "\n".join(lines)
 
 
-def _deadline_datetime(reference: datetime, hhmm: str) -> datetime:
+@functools.lru_cache(maxsize=256)
+def _parse_hhmm(hhmm: str) -> time:
+    # Deadline strings never change after seeding, so parse each one once.
     h, m = hhmm.split(":")
-    deadline_time = time(int(h), int(m))
-    return datetime.combine(reference.date(), deadline_time)
+    return time(int(h), int(m))
+
+
+def _deadline_datetime(reference: datetime, hhmm: str) -> datetime:
+    return datetime.combine(reference.date(), _parse_hhmm(hhmm))
+
+
+# process_id -> specialized checker closure. Built lazily from the first
+# reminder row seen for a process, so rows added via upsert_processes get
+# their checker on the next tick without any registration hook.
+_CHECKS: Dict[int, object] = {}
+
+
+def _compile_check(deadline_hhmm: str, periodicity: str, proc_name: str):
+    """
+    Partial-evaluate one process's reminder check: the parsed deadline
+    time, reminder offsets and message prefix are bound once, and the
+    concrete deadline/reminder instants are re-derived only when the day
+    changes. The per-row tick path is then a date compare plus integer
+    mask tests with no string parsing or dict lookups.
+    """
+    deadline_t = _parse_hhmm(deadline_hhmm)
+    offsets = tuple(
+        (idx, timedelta(minutes=m)) for idx, m in enumerate(REMINDER_MINUTES, start=1)
+    )
+    prefix = f"Напоминание: {proc_name} (дедлайн {deadline_hhmm}, {periodicity}). "
+    cached_date = None
+    deadline_dt = None
+    reminder_times = ()
+
+    def check(now: datetime, target_date, sent_mask: int):
+        """Return (due reminder indexes, message text) or None."""
+        nonlocal cached_date, deadline_dt, reminder_times
+        if target_date != cached_date:
+            cached_date = target_date
+            deadline_dt = datetime.combine(target_date, deadline_t)
+            reminder_times = [(idx, deadline_dt - off) for idx, off in offsets]
+
+        # Не шлем после дедлайна.
+        if now >= deadline_dt:
+            return None
+
+        due = [
+            idx
+            for idx, reminder_time in reminder_times
+            if not sent_mask & (1 << idx) and now >= reminder_time
+        ]
+        if not due:
+            return None
+        text = prefix + f"Осталось {humanize_delta(deadline_dt - now)}."
+        return due, text
+
+    return check
+
+
+# Phrase table indexed by [overdue][has_hours]; one divmod picks the row.
+_DELTA_FMT = (
+    ("через {m} мин", "через {h} ч {m} мин"),
+    ("просрочено на {m} мин", "просрочено на {h} ч {m} мин"),
+)
 
 
 def humanize_delta(delta: timedelta) -> str:
     minutes = int(delta.total_seconds() // 60)
-    if minutes < 0:
-        minutes = abs(minutes)
-        return f"просрочено на {minutes} мин"
-    if minutes < 60:
-        return f"через {minutes} мин"
+    overdue = minutes < 0
+    if overdue:
+        minutes = -minutes
     hours, mins = divmod(minutes, 60)
-    return f"через {hours} ч {mins} мин"
+    return _DELTA_FMT[overdue][hours > 0].format(h=hours, m=mins)
 
 
-def build_check_response(now: datetime, owner_name: str) -> str:
-    processes = get_processes_for_owner(CONN, owner_name)
+async def build_check_response(now: datetime, owner_name: str) -> str:
+    processes = await get_processes_for_owner(CONN, owner_name)
     if not processes:
         return "Нет процессов для расчета."
 
@@ -117,7 +220,8 @@ def build_check_response(now: datetime, owner_name: str) -> str:
             # humanize_delta уже формирует "через X"; уберем лишнее слово.
             status = f"✅ успеваете, осталось {humanize_delta(delta).replace('через ', '')}"
         else:
-            status = f"⚠️ дедлайн прошел, просрочено на {humanize_delta(delta)}"
+            # humanize_delta уже содержит "просрочено на".
+            status = f"⚠️ дедлайн прошел, {humanize_delta(delta)}"
         lines.append(f"• {p['name']} — дедлайн {p['deadline_time']} — {status}")
     return "\n".join(lines)
 
@@ -140,7 +244,7 @@ async def handle_message(message: Dict) -> None:
     text = message.get("text", "").strip()
     tg_id = user["id"]
     tg_username = user.get("username")
-    registered = get_user(CONN, tg_id)
+    registered = await get_user(CONN, tg_id)
 
     # Registration flow: after /start ask name; next plain text registers.
     if text.startswith("/start"):
@@ -152,7 +256,7 @@ async def handle_message(message: Dict) -> None:
 
     # If not registered yet, treat any non-command text as the name.
     if not registered and text and not text.startswith("/"):
-        register_user(CONN, tg_id, text, tg_username)
+        await register_user(CONN, tg_id, text, tg_username)
         await send_message(
             chat_id,
             f"Записал: {text}. Теперь доступна команда /my и /check DD-MM-YYYY HH:MM",
@@ -167,7 +271,7 @@ async def handle_message(message: Dict) -> None:
     owner_name = registered["name"]
 
     if text.startswith("/my"):
-        await send_message(chat_id, format_process_list(owner_name))
+        await send_message(chat_id, await format_process_list(owner_name))
         return
 
     if text.startswith("/check"):
@@ -177,7 +281,7 @@ async def handle_message(message: Dict) -> None:
                 chat_id, "Используйте формат: /check 15-12-2025 09:00"
             )
             return
-        await send_message(chat_id, build_check_response(check_dt, owner_name))
+        await send_message(chat_id, await build_check_response(check_dt, owner_name))
         return
 
     await send_message(chat_id, build_help(True))
@@ -186,29 +290,35 @@ async def handle_message(message: Dict) -> None:
 async def polling_loop() -> None:
     offset: Optional[int] = None
     logger.info("Starting long polling...")
-    async with httpx.AsyncClient(timeout=35) as client:
-        while True:
-            try:
-                resp = await client.get(
-                    f"{TELEGRAM_API}/getUpdates",
-                    params={"timeout": 25, "offset": offset},
-                )
-                data = resp.json()
-                if not data.get("ok"):
-                    logger.error("getUpdates error: %s", data)
-                    await asyncio.sleep(2)
+    while True:
+        try:
+            resp = await HTTP.get(
+                "/getUpdates",
+                params={
+                    "timeout": 50,
+                    "offset": offset,
+                    # Telegram expects a JSON-serialized array here; only
+                    # plain messages matter, so skip other update types.
+                    "allowed_updates": '["message"]',
+                },
+                timeout=60,  # must outlive the long-poll timeout above
+            )
+            data = resp.json()
+            if not data.get("ok"):
+                logger.error("getUpdates error: %s", data)
+                await asyncio.sleep(2)
+                continue
+
+            for update in data.get("result", []):
+                offset = update["update_id"] + 1
+                message = update.get("message")
+                if not message:
                     continue
-
-                for update in data.get("result", []):
-                    offset = update["update_id"] + 1
-                    message = update.get("message") or update.get("edited_message")
-                    if not message:
-                        continue
-                    logger.info("Update received: %s", update)
-                    await handle_message(message)
-            except Exception as exc:
-                logger.error("Polling error: %s", exc)
-                await asyncio.sleep(3)
+                logger.info("Update received: %s", update)
+                await handle_message(message)
+        except Exception as exc:
+            logger.error("Polling error: %s", exc)
+            await asyncio.sleep(3)
 
 
 async def reminders_loop(poll_seconds: int = 60) -> None:
@@ -219,47 +329,82 @@ async def reminders_loop(poll_seconds: int = 60) -> None:
     while True:
         now = datetime.now()
         try:
-            users = get_all_users(CONN)
-            for user in users:
-                processes = get_processes_for_owner(CONN, user["name"])
-                if not processes:
+            target_date = now.date()
+            today_iso = target_date.isoformat()
+            # One JOIN over users/processes/reminder_logs instead of a
+            # query per user; sent_mask filters already-logged reminders.
+            rows = await get_due_reminders(CONN, today_iso)
+            if not rows:
+                # No registered users (or no processes) — nothing to scan
+                # or commit this tick.
+                await asyncio.sleep(poll_seconds)
+                continue
+
+            # Collect messages first; all inserts of the tick share one
+            # transaction so N reminders cost a single commit/fsync.
+            pending = []
+            for (
+                telegram_id,
+                user_id,
+                process_id,
+                proc_name,
+                periodicity,
+                deadline_hhmm,
+                _rem1,
+                _rem2,
+                sent_mask,
+            ) in rows:
+                check = _CHECKS.get(process_id)
+                if check is None:
+                    check = _CHECKS[process_id] = _compile_check(
+                        deadline_hhmm, periodicity, proc_name
+                    )
+
+                result = check(now, target_date, sent_mask)
+                if result is None:
                     continue
 
-                for p in processes:
-                    target_date = now.date()
-                    deadline_dt = _deadline_datetime(
-                        datetime.combine(target_date, time()), p["deadline_time"]
+                due, text = result
+                for idx in due:
+                    inserted = await record_reminder_sent(
+                        CONN,
+                        user_id,
+                        process_id,
+                        today_iso,
+                        idx,
                     )
-
-                    # Не шлем после дедлайна.
-                    if now >= deadline_dt:
-                        continue
-
-                    for idx, minutes_before in enumerate(REMINDER_MINUTES, start=1):
-                        reminder_time = deadline_dt - timedelta(minutes=minutes_before)
-                        if now >= reminder_time:
-                            inserted = record_reminder_sent(
-                                CONN,
-                                user["id"],
-                                p["id"],
-                                target_date.isoformat(),
-                                idx,
-                            )
-                            if inserted:
-                                to_deadline = deadline_dt - now
-                                text = (
-                                    f"Напоминание: {p['name']} (дедлайн {p['deadline_time']}, {p['periodicity']}). "
-                                    f"Осталось {humanize_delta(to_deadline)}."
-                                )
-                                await send_message(user["telegram_id"], text)
+                    if inserted:
+                        pending.append((telegram_id, text))
+            await CONN.commit()
+
+            # Enqueue only after the commit so a Telegram failure can't
+            # roll back rows and cause duplicate reminders next tick. The
+            # sender workers drain the queue concurrently, so the tick
+            # finishes in DB time regardless of network latency.
+            for item in pending:
+                SEND_QUEUE.put_nowait(item)
         except Exception as exc:
             logger.error("Reminder loop error: %s", exc)
+            try:
+                await CONN.rollback()
+            except Exception:
+                pass
 
         await asyncio.sleep(poll_seconds)
 
 
 if __name__ == "__main__":
     async def main():
-        await asyncio.gather(polling_loop(), reminders_loop())
+        global CONN
+        CONN = await get_async_connection()
+        try:
+            await asyncio.gather(
+                polling_loop(),
+                reminders_loop(),
+                *(sender_worker() for _ in range(SEND_WORKERS)),
+            )
+        finally:
+            await CONN.close()
+            await HTTP.aclose()
 
     asyncio.run(main())